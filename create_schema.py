@@ -3,9 +3,38 @@
 Skrypt do tworzenia schematu bazy danych dla aplikacji trialwatch.
 """
 
+import hashlib
+import json
 import os
+from pathlib import Path
+
 from db_client import PSQLWrapper
 
+# Cache wyników introspekcji information_schema - te zapytania są wolne
+# (joiny po katalogach), a schemat zmienia się tylko razem z DDL powyżej.
+SCHEMA_CACHE_DIR = Path.home() / ".trialwatch_schema_cache"
+
+
+def _load_schema_cache(ddl_hash: str):
+    """Wczytuje zrzut schematu z cache (None gdy brak wpisu dla tego DDL)."""
+    cache_file = SCHEMA_CACHE_DIR / f"{ddl_hash}.json"
+    if not cache_file.exists():
+        return None
+    try:
+        return json.loads(cache_file.read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _save_schema_cache(ddl_hash: str, snapshot: dict) -> None:
+    """Zapisuje zrzut schematu do cache (best-effort)."""
+    try:
+        SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (SCHEMA_CACHE_DIR / f"{ddl_hash}.json").write_text(json.dumps(snapshot))
+    except OSError as e:
+        print(f"⚠️ Nie można zapisać cache schematu: {e}")
+
+
 def create_schema():
     """Utworzenie schematu bazy danych dla badań klinicznych."""
     
@@ -36,10 +65,14 @@ def create_schema():
         healthy_volunteers BOOLEAN,
         url TEXT,
         source VARCHAR(50) DEFAULT 'clinicaltrials.gov',
+        content_hash BYTEA, -- Hash zawartości (xxh3) do pomijania niezmienionych wierszy
         last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
 
+    -- Migracja dla istniejących instalacji
+    ALTER TABLE clinical_trials ADD COLUMN IF NOT EXISTS content_hash BYTEA;
+
     -- Tabela dla badań z EU CTIS (gdy będzie dostępne API)
     CREATE TABLE IF NOT EXISTS eu_clinical_trials (
         id SERIAL PRIMARY KEY,
@@ -63,9 +96,23 @@ def create_schema():
     CREATE INDEX IF NOT EXISTS idx_clinical_trials_nct_id ON clinical_trials(nct_id);
     CREATE INDEX IF NOT EXISTS idx_clinical_trials_status ON clinical_trials(status);
     CREATE INDEX IF NOT EXISTS idx_clinical_trials_phase ON clinical_trials(phase);
-    CREATE INDEX IF NOT EXISTS idx_clinical_trials_conditions ON clinical_trials USING GIN(conditions);
-    CREATE INDEX IF NOT EXISTS idx_clinical_trials_keywords ON clinical_trials USING GIN(keywords);
+    -- fastupdate: wstawki do GIN trafiają najpierw do taniej pending list
+    -- (scalanej okresowo), zamiast natychmiastowej aktualizacji drzewa postingowego
+    CREATE INDEX IF NOT EXISTS idx_clinical_trials_conditions ON clinical_trials
+        USING GIN(conditions) WITH (fastupdate = on, gin_pending_list_limit = 65536);
+    CREATE INDEX IF NOT EXISTS idx_clinical_trials_keywords ON clinical_trials
+        USING GIN(keywords) WITH (fastupdate = on, gin_pending_list_limit = 65536);
     CREATE INDEX IF NOT EXISTS idx_clinical_trials_last_updated ON clinical_trials(last_updated);
+    CREATE INDEX IF NOT EXISTS idx_clinical_trials_content_hash ON clinical_trials(nct_id, content_hash);
+
+    -- Indeksy częściowe pod gorący wzorzec zapytań: świeżo aktualizowane
+    -- badania w toku - dużo mniejsze drzewa niż pełne indeksy status/last_updated
+    CREATE INDEX IF NOT EXISTS idx_clinical_trials_active_recent
+        ON clinical_trials (last_updated DESC)
+        WHERE status IN ('RECRUITING', 'ACTIVE_NOT_RECRUITING', 'ENROLLING_BY_INVITATION');
+    CREATE INDEX IF NOT EXISTS idx_clinical_trials_open_nct
+        ON clinical_trials (nct_id) INCLUDE (status, last_updated)
+        WHERE status <> 'COMPLETED';
 
     CREATE INDEX IF NOT EXISTS idx_eu_clinical_trials_eu_ct_number ON eu_clinical_trials(eu_ct_number);
     CREATE INDEX IF NOT EXISTS idx_eu_clinical_trials_status ON eu_clinical_trials(status);
@@ -100,33 +147,49 @@ def create_schema():
             print("❌ Błąd podczas tworzenia schematu")
             return False
         
-        # Sprawdź utworzone tabele
-        result = client.execute_query("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            ORDER BY table_name;
-        """)
-        
-        if result:
+        # Introspekcja z cache - zapytania do information_schema wykonujemy
+        # tylko gdy DDL się zmienił (klucz = hash SQL-a powyżej)
+        ddl_hash = hashlib.sha256(create_tables_sql.encode()).hexdigest()
+        snapshot = _load_schema_cache(ddl_hash)
+
+        if snapshot is None:
+            # Tabele i kolumny jednym zapytaniem - agregacja do jsonb po
+            # stronie serwera zamiast dwóch round-tripów i pętli w Pythonie
+            rows = client.execute_query("""
+                SELECT jsonb_object_agg(table_name, cols)
+                FROM (
+                    SELECT c.table_name,
+                           jsonb_agg(jsonb_build_object(
+                               'name', column_name,
+                               'type', data_type,
+                               'nullable', is_nullable
+                           ) ORDER BY ordinal_position) AS cols
+                    FROM information_schema.columns c
+                    WHERE c.table_schema = 'public'
+                    GROUP BY c.table_name
+                ) t;
+            """)
+
+            schema = rows[0][0] if rows and rows[0][0] else {}
+            snapshot = {
+                "tables": sorted(schema),
+                "columns": schema.get("clinical_trials", []),
+            }
+            _save_schema_cache(ddl_hash, snapshot)
+        else:
+            print("(struktura schematu z cache)")
+
+        if snapshot["tables"]:
             print("\n📋 Utworzone tabele:")
-            for row in result:
-                print(f"  - {row[0]}")
-            
-        # Sprawdź strukturę głównej tabeli
-        result = client.execute_query("""
-            SELECT column_name, data_type, is_nullable
-            FROM information_schema.columns 
-            WHERE table_name = 'clinical_trials' 
-            ORDER BY ordinal_position;
-        """)
-        
-        if result:
+            for table_name in snapshot["tables"]:
+                print(f"  - {table_name}")
+
+        if snapshot["columns"]:
             print("\n🏗️ Struktura tabeli clinical_trials:")
-            for row in result:
-                nullable = "NULL" if row[2] == "YES" else "NOT NULL"
-                print(f"  - {row[0]}: {row[1]} ({nullable})")
-        
+            for col in snapshot["columns"]:
+                nullable = "NULL" if col["nullable"] == "YES" else "NOT NULL"
+                print(f"  - {col['name']}: {col['type']} ({nullable})")
+
         client.close()
             
     except Exception as e:
@@ -2,18 +2,25 @@
 
 from __future__ import annotations
 
-import hashlib
+import atexit
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Any, Dict, Iterator, List, Optional
 
+import msgspec
+import orjson
+import psycopg
 import requests
+import xxhash
 from dotenv import load_dotenv
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from psycopg_pool import ConnectionPool
+from pydantic import BaseModel, ConfigDict, field_validator
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from db_client import PSQLWrapper
+from db_client import DEFAULT_CONN_STRING, PSQLWrapper
 
 # ---- Konfiguracja z pliku .env (opcjonalnie) ----
 load_dotenv()
@@ -21,54 +28,96 @@ CTG_ENDPOINT = os.getenv("CTG_ENDPOINT", "https://clinicaltrials.gov/api/v2/stud
 CTG_RPS = float(os.getenv("CTG_RPS", "5"))
 PAGE_SIZE = int(os.getenv("CTG_PAGE_SIZE", "50"))
 _SLEEP = 1.0 / CTG_RPS
+# Od tego rozmiaru batcha zapis idzie przez COPY zamiast INSERT-ów
+COPY_THRESHOLD = int(os.getenv("CTG_COPY_THRESHOLD", "1000"))
+
+# ---- Pula połączeń do PostgreSQL ----
+# Jedna pula na cały proces - unikamy kosztu TCP+TLS+auth przy każdym batchu.
+DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_CONN_STRING)
+_POOL: Optional[ConnectionPool] = None
+
+
+def _configure_conn(conn: psycopg.Connection) -> None:
+    """Konfiguruje świeże połączenie z puli.
+
+    prepare_threshold=0 sprawia, że psycopg3 przygotowuje (PREPARE) upsert
+    po stronie serwera już przy pierwszym wykonaniu, więc kolejne batche
+    w tej samej sesji nie płacą za ponowny Parse+Plan.
+    """
+    conn.prepare_threshold = 0
+
+
+def _get_pool() -> ConnectionPool:
+    """Zwraca współdzieloną pulę połączeń (tworzy ją leniwie przy pierwszym użyciu)."""
+    global _POOL
+    if _POOL is None:
+        _POOL = ConnectionPool(
+            conninfo=DATABASE_URL,
+            min_size=1,
+            max_size=4,
+            configure=_configure_conn,
+            kwargs={"autocommit": False, "application_name": "trialwatch_ctgov"},
+        )
+        atexit.register(_POOL.close)
+    return _POOL
 
 
 # -----------------------------------------------------------------------------#
 #                                MODELE DANYCH                                 #
 # -----------------------------------------------------------------------------#
-class IdentificationModule(BaseModel):
-    nct_id: str = Field(alias="nctId")
-    brief_title: Optional[str] = Field(alias="briefTitle", default=None)
-    official_title: Optional[str] = Field(alias="officialTitle", default=None)
+# Modele odpowiedzi API to msgspec.Struct zamiast Pydantic - dekodowanie
+# jest kilkukrotnie szybsze, a to dominujący koszt CPU per badanie.
+# Publiczny model Trial pozostaje Pydantic (model_dump_json itd.).
+class IdentificationModule(msgspec.Struct):
+    nct_id: str = msgspec.field(name="nctId")
+    brief_title: Optional[str] = msgspec.field(name="briefTitle", default=None)
+    official_title: Optional[str] = msgspec.field(name="officialTitle", default=None)
 
     @property
     def title(self) -> Optional[str]:
         return self.brief_title or self.official_title
 
 
-class DesignModule(BaseModel):
-    phases: List[str] = Field(default_factory=list)
+class DesignModule(msgspec.Struct):
+    phases: List[str] = msgspec.field(default_factory=list)
 
 
-class StatusModule(BaseModel):
-    overall_status: str = Field(alias="overallStatus")
-    last_changed_date: Optional[str] = Field(alias="lastChangedDate", default=None)
+class StatusModule(msgspec.Struct):
+    overall_status: str = msgspec.field(name="overallStatus")
+    last_changed_date: Optional[str] = msgspec.field(name="lastChangedDate", default=None)
 
 
-class ConditionsModule(BaseModel):
-    conditions: List[str] = Field(default_factory=list)
+class ConditionsModule(msgspec.Struct):
+    conditions: List[str] = msgspec.field(default_factory=list)
 
 
-class Location(BaseModel):
+class Location(msgspec.Struct):
     country: Optional[str] = None
 
 
-class ContactsLocationsModule(BaseModel):
-    locations: List[Location] = Field(default_factory=list)
+class ContactsLocationsModule(msgspec.Struct):
+    locations: List[Location] = msgspec.field(default_factory=list)
 
 
-class ProtocolSection(BaseModel):
-    identification_module: IdentificationModule = Field(alias="identificationModule")
-    design_module: Optional[DesignModule] = Field(alias="designModule", default=None)
-    status_module: StatusModule = Field(alias="statusModule")
-    conditions_module: Optional[ConditionsModule] = Field(alias="conditionsModule", default=None)
-    contacts_locations_module: Optional[ContactsLocationsModule] = Field(
-        alias="contactsLocationsModule", default=None
+class ProtocolSection(msgspec.Struct):
+    identification_module: IdentificationModule = msgspec.field(name="identificationModule")
+    status_module: StatusModule = msgspec.field(name="statusModule")
+    design_module: Optional[DesignModule] = msgspec.field(name="designModule", default=None)
+    conditions_module: Optional[ConditionsModule] = msgspec.field(
+        name="conditionsModule", default=None
+    )
+    contacts_locations_module: Optional[ContactsLocationsModule] = msgspec.field(
+        name="contactsLocationsModule", default=None
     )
 
 
-class ApiStudy(BaseModel):
-    protocol_section: ProtocolSection = Field(alias="protocolSection")
+class ApiStudy(msgspec.Struct):
+    protocol_section: ProtocolSection = msgspec.field(name="protocolSection")
+
+
+# Typ do walidacji całej strony jednym wywołaniem msgspec.convert
+# zamiast osobnego dispatchu per badanie.
+_PAGE_STUDIES_TYPE = List[ApiStudy]
 
 
 class Trial(BaseModel):
@@ -100,11 +149,15 @@ class Trial(BaseModel):
         p = api.protocol_section
         countries = []
         if p.contacts_locations_module:
-            countries = [
-                loc.country
-                for loc in p.contacts_locations_module.locations
-                if loc.country
-            ]
+            # dict.fromkeys deduplikuje zachowując kolejność z API
+            # (list(set(...)) mieszało kolejność między uruchomieniami)
+            countries = list(
+                dict.fromkeys(
+                    loc.country
+                    for loc in p.contacts_locations_module.locations
+                    if loc.country
+                )
+            )
 
         # Bezpiecznie obsłuż opcjonalne moduły
         phases = p.design_module.phases if p.design_module else []
@@ -116,7 +169,7 @@ class Trial(BaseModel):
             phases=phases,
             status=p.status_module.overall_status,
             conditions=conditions,
-            countries=list(set(countries)),
+            countries=countries,
             last_changed=p.status_module.last_changed_date,
             raw=raw,
         )
@@ -125,15 +178,38 @@ class Trial(BaseModel):
 # -----------------------------------------------------------------------------#
 #                             WYWOŁANIE API + RETRY                             #
 # -----------------------------------------------------------------------------#
+# Jedna sesja HTTP na moduł - keep-alive zamiast nowego TCP+TLS per strona.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+)
+SESSION.headers["Accept-Encoding"] = "gzip, br"
+
+
 @retry(wait=wait_exponential(multiplier=1, min=2, max=10), stop=stop_after_attempt(5))
-def _get(params: Dict[str, Any]) -> Dict[str, Any]:
-    resp = requests.get(CTG_ENDPOINT, params=params, timeout=30)
+def _get_page_bytes(params: Dict[str, Any]) -> bytes:
+    resp = SESSION.get(CTG_ENDPOINT, params=params, timeout=30)
     try:
         resp.raise_for_status()
     except requests.HTTPError as e:
         print("HTTP", resp.status_code, resp.text[:200], "…")
         raise e
-    return resp.json()
+    return resp.content
+
+
+class _PageToken(msgspec.Struct):
+    """Sam token paginacji - tani dekod bez parsowania całej strony."""
+    next_page_token: Optional[str] = msgspec.field(name="nextPageToken", default=None)
+
+
+_TOKEN_DECODER = msgspec.json.Decoder(_PageToken)
+
+def _decode_page(content: bytes) -> List[Trial]:
+    """Dekoduje stronę API do listy Trial."""
+    data = orjson.loads(content)
+    raws = data.get("studies", [])
+    studies = msgspec.convert(raws, _PAGE_STUDIES_TYPE)
+    return [Trial.from_api(api, raw) for api, raw in zip(studies, raws)]
 
 
 # -----------------------------------------------------------------------------#
@@ -146,8 +222,10 @@ def get_trials(
     page_size: int = PAGE_SIZE,
 ) -> Iterator[Trial]:
     """
-    Zwraca kolejne badania. Filtrowanie po fazie i dacie odbywa się lokalnie,
-    aby zapewnić maksymalną stabilność i uniknąć błędów 400 Bad Request.
+    Zwraca kolejne badania. Filtry fazy i daty idą w filter.advanced do API,
+    żeby nie pobierać stron, które i tak byśmy odrzucili; lokalny filtr
+    zostaje jako defensywny fallback (historycznie API potrafiło zwracać
+    400 Bad Request albo ignorować wyrażenia filtrów).
     """
     params = {
         "query.cond": condition,
@@ -161,138 +239,253 @@ def get_trials(
         "format": "json",
     }
 
-    page_token: Optional[str] = None
-    dt_since = datetime.fromisoformat(since) if since else None
-
-    while True:
-        if page_token:
-            params["pageToken"] = page_token
-
-        data = _get(params)
-        for raw in data.get("studies", []):
-            trial = Trial.from_api(ApiStudy.model_validate(raw), raw)
-
-            if phase and phase not in [p.strip() for p in trial.phases]:
-                continue
-            if dt_since and trial.last_changed and trial.last_changed < dt_since:
-                continue
+    # Filtry fazy/daty przenosimy do zapytania API - bez tego pobieramy
+    # i parsujemy badania, które i tak zostałyby odrzucone lokalnie.
+    advanced_filters = []
+    if phase:
+        advanced_filters.append(f'AREA[Phase]"{phase}"')
+    if since:
+        advanced_filters.append(f"AREA[LastUpdatePostDate]RANGE[{since},MAX]")
+    if advanced_filters:
+        params["filter.advanced"] = " AND ".join(advanced_filters)
 
-            yield trial
+    dt_since = datetime.fromisoformat(since) if since else None
 
-        page_token = data.get("nextPageToken")
-        if not page_token:
-            break
-        time.sleep(_SLEEP)
+    def _fetch(token: Optional[str]) -> bytes:
+        if token:
+            # Rate limit liczony w wątku pobierającym - sleep nakłada się
+            # z dekodowaniem bieżącej strony zamiast blokować konsumenta.
+            time.sleep(_SLEEP)
+        page_params = dict(params)
+        if token:
+            page_params["pageToken"] = token
+        return _get_page_bytes(page_params)
+
+    # Paginacja tokenowa wymusza kolejność stron, ale kolejną stronę możemy
+    # pobierać w tle (requests zwalnia GIL na I/O), a dekod robimy lokalnie -
+    # pobranie kolejnej strony nakłada się wtedy z dekodowaniem bieżącej.
+    # Token wyciągamy tanim, częściowym dekodem, żeby nie czekać na pełny.
+    with ThreadPoolExecutor(max_workers=1) as fetcher:
+        page_future = fetcher.submit(_fetch, None)
+        while True:
+            content = page_future.result()
+
+            page_token = _TOKEN_DECODER.decode(content).next_page_token
+            if page_token:
+                page_future = fetcher.submit(_fetch, page_token)
+
+            for trial in _decode_page(content):
+                # Defensywny fallback - filtry działają już po stronie API,
+                # ale nie ufamy mu ślepo.
+                if phase and phase not in [p.strip() for p in trial.phases]:
+                    continue
+                if dt_since and trial.last_changed and trial.last_changed < dt_since:
+                    continue
+
+                yield trial
+
+            if not page_token:
+                break
 
 
-def save_trials_to_db(trials: List[Trial], connection_string: str = None) -> int:
+def save_trials_to_db(
+    trials: List[Trial],
+    connection_string: str = None,
+    conn: Optional[psycopg.Connection] = None,
+) -> int:
     """
     Zapisuje listę badań do bazy danych PostgreSQL z batch insert.
+    Używa współdzielonej puli połączeń (lub przekazanego połączenia),
+    więc nie płacimy kosztu TCP+TLS+auth przy każdym batchu.
     Zwraca liczbę zapisanych rekordów.
     """
     if not trials:
         return 0
-    
-    client = PSQLWrapper(connection_string)
-    if not client.connect():
-        print("❌ Nie można połączyć z bazą danych")
+
+    if conn is not None:
+        return _save_trials(conn, trials)
+
+    if connection_string:
+        # Jawny connection string - jednorazowe połączenie poza pulą
+        try:
+            with psycopg.connect(connection_string) as one_conn:
+                _configure_conn(one_conn)
+                return _save_trials(one_conn, trials)
+        except psycopg.OperationalError as e:
+            print(f"❌ Nie można połączyć z bazą danych: {e}")
+            return 0
+
+    try:
+        with _get_pool().connection() as pooled_conn:
+            return _save_trials(pooled_conn, trials)
+    except psycopg.OperationalError as e:
+        print(f"❌ Nie można połączyć z bazą danych: {e}")
         return 0
-    
+
+
+_STAGE_COLUMNS = (
+    "nct_id, title, status, phase, conditions, locations, "
+    "last_updated, source, url, content_hash"
+)
+
+# Jeden wspólny UPSERT dla ścieżki batch i fallbacku per wiersz
+_UPSERT_SQL = f"""
+    INSERT INTO clinical_trials (
+        {_STAGE_COLUMNS}
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+    ON CONFLICT (nct_id)
+    DO UPDATE SET
+        title = EXCLUDED.title,
+        status = EXCLUDED.status,
+        phase = EXCLUDED.phase,
+        conditions = EXCLUDED.conditions,
+        locations = EXCLUDED.locations,
+        last_updated = EXCLUDED.last_updated,
+        source = EXCLUDED.source,
+        url = EXCLUDED.url,
+        content_hash = EXCLUDED.content_hash
+    WHERE clinical_trials.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+"""
+
+
+# Prefiks URL badania - konkatenacja jest tańsza niż f-string per wiersz
+_URL_PREFIX = "https://clinicaltrials.gov/study/"
+
+
+def _trial_row(trial: Trial, now: datetime) -> tuple:
+    """Krotka wartości jednego wiersza dla INSERT/COPY do clinical_trials."""
+    return (
+        trial.id,
+        trial.title,
+        trial.status,
+        ", ".join(trial.phases) or None,
+        trial.conditions,
+        trial.countries,
+        trial.last_changed or now,
+        'clinicaltrials.gov',
+        _URL_PREFIX + trial.id,
+        bytes.fromhex(make_hash(trial)),
+    )
+
+
+@contextmanager
+def bulk_load(conn: psycopg.Connection):
+    """Ustawienia sesji pod masowy zapis (obowiązują do końca transakcji).
+
+    synchronous_commit=off nie czeka na fsync WAL przy commicie, a większy
+    maintenance_work_mem przyspiesza scalanie pending list indeksów GIN.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL synchronous_commit = off")
+        cur.execute("SET LOCAL maintenance_work_mem = '512MB'")
+    yield conn
+
+
+def _copy_trials(conn: psycopg.Connection, rows: Iterator[tuple], count: int) -> int:
+    """Bulk-load batcha przez COPY FROM STDIN do tabeli tymczasowej.
+
+    COPY omija narzut protokołu per wiersz; merge do clinical_trials
+    odbywa się jednym INSERT ... SELECT ... ON CONFLICT.
+    """
+    with bulk_load(conn), conn.cursor() as cur:
+        cur.execute(
+            "CREATE TEMP TABLE clinical_trials_stage "
+            "(LIKE clinical_trials INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        with cur.copy(
+            f"COPY clinical_trials_stage ({_STAGE_COLUMNS}) FROM STDIN"
+        ) as cp:
+            for row in rows:
+                cp.write_row(row)
+        cur.execute(f"""
+            INSERT INTO clinical_trials ({_STAGE_COLUMNS})
+            SELECT {_STAGE_COLUMNS} FROM clinical_trials_stage
+            ON CONFLICT (nct_id)
+            DO UPDATE SET
+                title = EXCLUDED.title,
+                status = EXCLUDED.status,
+                phase = EXCLUDED.phase,
+                conditions = EXCLUDED.conditions,
+                locations = EXCLUDED.locations,
+                last_updated = EXCLUDED.last_updated,
+                source = EXCLUDED.source,
+                url = EXCLUDED.url,
+                content_hash = EXCLUDED.content_hash
+            WHERE clinical_trials.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        """)
+    conn.commit()
+
+    print(f"✅ Zapisano {count} badań do bazy danych (COPY)")
+    return count
+
+
+def _save_trials(conn: psycopg.Connection, trials: List[Trial]) -> int:
+    """Właściwy zapis batcha na już otwartym połączeniu."""
     try:
-        # Przygotuj wszystkie wartości dla batch insert
-        values_list = []
-        for trial in trials:
-            phases_str = ", ".join(trial.phases) if trial.phases else None
-            conditions_array = trial.conditions if trial.conditions else []
-            countries_array = trial.countries if trial.countries else []
-            
-            values = (
-                trial.id,
-                trial.title,
-                trial.status,
-                phases_str,
-                conditions_array,
-                countries_array,
-                trial.last_changed or datetime.now(),
-                'clinicaltrials.gov',
-                f"https://clinicaltrials.gov/study/{trial.id}"
+        # Pomiń wiersze, których content_hash się nie zmienił - przy cyklicznym
+        # odpytywaniu to zdecydowana większość, a każdy zbędny UPDATE kosztuje
+        # WAL, utrzymanie indeksów GIN i churn TOAST.
+        hashes = {t.id: bytes.fromhex(make_hash(t)) for t in trials}
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT nct_id, content_hash FROM clinical_trials WHERE nct_id = ANY(%s)",
+                (list(hashes),),
             )
-            values_list.append(values)
-        
-        # Wykonaj batch insert
-        with client.conn.cursor() as cur:
-            # Dla psycopg3 - użyj executemany zamiast execute_values
-            single_insert = """
-                INSERT INTO clinical_trials (
-                    nct_id, title, status, phase, conditions, locations,
-                    last_updated, source, url
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
-                ON CONFLICT (nct_id) 
-                DO UPDATE SET
-                    title = EXCLUDED.title,
-                    status = EXCLUDED.status,
-                    phase = EXCLUDED.phase,
-                    conditions = EXCLUDED.conditions,
-                    locations = EXCLUDED.locations,
-                    last_updated = EXCLUDED.last_updated,
-                    source = EXCLUDED.source,
-                    url = EXCLUDED.url
-            """
-            
-            cur.executemany(single_insert, values_list)
-            client.conn.commit()
-        
+            existing = dict(cur.fetchall())
+        trials = [t for t in trials if existing.get(t.id) != hashes[t.id]]
+        if not trials:
+            print("✅ Batch bez zmian - pominięto zapis")
+            return 0
+
+        # Wiersze budujemy leniwie - executemany/COPY konsumują generator,
+        # więc nie materializujemy pośredniej listy krotek.
+        # datetime.now() raz na batch zamiast per wiersz.
+        now = datetime.now()
+        values_iter = (_trial_row(t, now) for t in trials)
+
+        # Dla dużych batchy COPY do tabeli tymczasowej + jeden merge
+        # jest o rząd wielkości szybszy niż wierszowe INSERT-y.
+        if len(trials) >= COPY_THRESHOLD:
+            return _copy_trials(conn, values_iter, len(trials))
+
+        # Wykonaj batch insert w trybie pipeline - psycopg3 wysyła wszystkie
+        # Bind/Execute jednym strumieniem zamiast czekać na round-trip per wiersz.
+        # binary=True: parametry (zwłaszcza TEXT[]) idą w formacie binarnym,
+        # bez budowania i parsowania tekstowych literałów tablic.
+        with conn.pipeline(), conn.cursor(binary=True) as cur:
+            cur.executemany(_UPSERT_SQL, values_iter)
+        conn.commit()
+
         print(f"✅ Zapisano {len(trials)} badań do bazy danych (batch)")
         return len(trials)
-        
-    except Exception as e:
+
+    except psycopg.IntegrityError as e:
         print(f"❌ Błąd podczas batch zapisu: {e}")
-        client.conn.rollback()
-        
-        # Fallback - spróbuj po jednym
-        print("   🔄 Próba zapisu pojedynczego...")
+        conn.rollback()
+
+        # Fallback: jedna transakcja + savepoint per wiersz - wycofujemy tylko
+        # wadliwy wiersz, a fsync WAL płacimy raz na końcu zamiast per commit.
+        print("   🔄 Ponowna próba z savepointami per wiersz...")
         saved_count = 0
-        for trial in trials:
-            try:
-                phases_str = ", ".join(trial.phases) if trial.phases else None
-                conditions_array = trial.conditions if trial.conditions else []
-                countries_array = trial.countries if trial.countries else []
-                
-                single_insert = """
-                    INSERT INTO clinical_trials (
-                        nct_id, title, status, phase, conditions, locations,
-                        last_updated, source, url
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                    ON CONFLICT (nct_id) DO NOTHING
-                """
-                
-                params = (
-                    trial.id, trial.title, trial.status, phases_str,
-                    conditions_array, countries_array,
-                    trial.last_changed or datetime.now(),
-                    'clinicaltrials.gov',
-                    f"https://clinicaltrials.gov/study/{trial.id}"
-                )
-                
-                with client.conn.cursor() as cur:
-                    cur.execute(single_insert, params)
-                    client.conn.commit()
+        with conn.transaction():
+            for trial in trials:
+                try:
+                    with conn.transaction():
+                        with conn.cursor(binary=True) as cur:
+                            cur.execute(_UPSERT_SQL, _trial_row(trial, now))
                     saved_count += 1
-                    
-            except Exception as single_error:
-                print(f"   ❌ Błąd {trial.id}: {single_error}")
-                client.conn.rollback()
-                continue
-        
+                except psycopg.IntegrityError as single_error:
+                    print(f"   ❌ Błąd {trial.id}: {single_error}")
+
         print(f"   💾 Fallback: zapisano {saved_count}/{len(trials)} badań")
         return saved_count
-        
-    finally:
-        client.close()
+
+    except Exception as e:
+        print(f"❌ Błąd podczas batch zapisu: {e}")
+        conn.rollback()
+        return 0
 
 
 def get_trials_and_save(
@@ -318,35 +511,38 @@ def get_trials_and_save(
     total_saved = 0
     batch = []
     count = 0
-    
+
     try:
-        for trial in get_trials(condition, phase, since, page_size):
-            batch.append(trial)
-            count += 1
-            
-            # Zapisz batch gdy osiągnie rozmiar lub gdy skończymy
-            if len(batch) >= batch_size:
-                saved = save_trials_to_db(batch, connection_string)
+        # Jedno połączenie z puli na cały przebieg - wszystkie batche
+        # współdzielą tę samą sesję zamiast łączyć się od nowa.
+        with _get_pool().connection() as conn:
+            for trial in get_trials(condition, phase, since, page_size):
+                batch.append(trial)
+                count += 1
+
+                # Zapisz batch gdy osiągnie rozmiar lub gdy skończymy
+                if len(batch) >= batch_size:
+                    saved = save_trials_to_db(batch, conn=conn)
+                    total_saved += saved
+                    print(f"   📦 Batch {count//batch_size}: zapisano {saved}/{len(batch)} badań")
+                    batch = []  # Wyczyść batch
+
+                if count >= max_trials:
+                    print(f"   🔚 Osiągnięto limit {max_trials} badań")
+                    break
+
+                if count % 10 == 0:
+                    print(f"   📊 Pobrano {count} badań...")
+
+            # Zapisz pozostały niepełny batch
+            if batch:
+                saved = save_trials_to_db(batch, conn=conn)
                 total_saved += saved
-                print(f"   📦 Batch {count//batch_size}: zapisano {saved}/{len(batch)} badań")
-                batch = []  # Wyczyść batch
-            
-            if count >= max_trials:
-                print(f"   🔚 Osiągnięto limit {max_trials} badań")
-                break
-                
-            if count % 10 == 0:
-                print(f"   📊 Pobrano {count} badań...")
-        
-        # Zapisz pozostały niepełny batch
-        if batch:
-            saved = save_trials_to_db(batch, connection_string)
-            total_saved += saved
-            print(f"   📦 Ostatni batch: zapisano {saved}/{len(batch)} badań")
-        
+                print(f"   📦 Ostatni batch: zapisano {saved}/{len(batch)} badań")
+
         print(f"✅ Łącznie zapisano {total_saved}/{count} badań do bazy")
         return total_saved
-        
+
     except Exception as e:
         print(f"❌ Błąd podczas pobierania/zapisu: {e}")
         # Spróbuj zapisać to co mamy w batch
@@ -358,8 +554,10 @@ def get_trials_and_save(
 
 
 def make_hash(trial: Trial) -> str:
+    """Hash do wykrywania zmian - nie kryptograficzny, więc xxh3 zamiast SHA-1."""
     stamp = trial.last_changed.isoformat() if trial.last_changed else ""
-    return hashlib.sha1(f"{trial.id}:{stamp}".encode()).hexdigest()
+    # xxhash 4.x nie przyjmuje str - podajemy bajty jawnie
+    return xxhash.xxh3_128_hexdigest(f"{trial.id}:{stamp}".encode())
 
 
 # -----------------------------------------------------------------------------#
@@ -398,11 +596,15 @@ if __name__ == "__main__":
     try:
         client = PSQLWrapper()
         if client.connect():
+            # reltuples ze statystyk plannera zamiast COUNT(*) - pełny
+            # sequential scan rósłby liniowo z tabelą, a do diagnostyki
+            # wystarczy przybliżona liczba wierszy
             result = client.execute_query("""
-                SELECT COUNT(*) as total, 
-                       COUNT(DISTINCT status) as statuses,
-                       MAX(last_updated) as last_update
-                FROM clinical_trials;
+                SELECT reltuples::bigint AS approx_rows,
+                       (SELECT COUNT(DISTINCT status) FROM clinical_trials) AS statuses,
+                       (SELECT MAX(last_updated) FROM clinical_trials) AS last_update
+                FROM pg_class
+                WHERE relname = 'clinical_trials';
             """)
             
             result2 = client.execute_query("""
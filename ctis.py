@@ -7,8 +7,9 @@ from __future__ import annotations
 import time
 from typing import Any, Dict, Iterator, List, Optional
 
+import msgspec
 import requests
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 # --- Krok 1: Konfiguracja modułu ---
@@ -31,14 +32,13 @@ class UnifiedStudy(BaseModel):
 
 
 # Model pomocniczy, mapujący odpowiedź z API CTIS
-class CtisApiStudy(BaseModel):
+# msgspec.Struct zamiast Pydantic - dekodowanie jest kilkukrotnie szybsze,
+# a dodatkowe pola z API są ignorowane domyślnie.
+class CtisApiStudy(msgspec.Struct):
     """Bezpośrednie mapowanie pól z 'entries' w odpowiedzi API CTIS."""
-    trial_id: str = Field(alias="trialId")
-    title: Optional[str] = Field(alias="title", default=None)
-    trial_status: str = Field(alias="trialStatus")
-
-    # Używamy ConfigDict do ignorowania dodatkowych pól z API
-    model_config = ConfigDict(extra="ignore")
+    trial_id: str = msgspec.field(name="trialId")
+    trial_status: str = msgspec.field(name="trialStatus")
+    title: Optional[str] = None
 
 
 # --- Krok 3: Funkcja pomocnicza do pobierania danych ---
@@ -72,31 +72,29 @@ def _create_mock_trial_data() -> List[Dict[str, Any]]:
     ]
 
 
+# Mock dane są statyczne i identyczne przy każdym wywołaniu - walidujemy
+# i mapujemy je raz, przy imporcie modułu.
+_MOCK_STUDIES = tuple(
+    UnifiedStudy(
+        id=api_study.trial_id,
+        title=api_study.title,
+        status=api_study.trial_status,
+        source="EU CTIS (MOCK)",
+        raw=entry,
+    )
+    for entry in _create_mock_trial_data()
+    for api_study in (msgspec.convert(entry, CtisApiStudy),)
+)
+
+
 # --- Mock implementacja dla demonstracji ---
 def get_trials_mock(condition: str, limit: int = 100) -> Iterator[UnifiedStudy]:
     """
     Mock implementacja pokazująca jak działałby moduł gdyby API było dostępne.
     """
     print(f"Mock: Symulacja pobierania danych dla condition='{condition}', limit={limit}")
-    
-    mock_data = _create_mock_trial_data()
-    
-    for i, entry in enumerate(mock_data):
-        if i >= limit:
-            break
-            
-        # Parsujemy i walidujemy dane
-        api_study = CtisApiStudy.model_validate(entry)
-        
-        # Mapujemy na nasz ujednolicony model
-        unified_study = UnifiedStudy(
-            id=api_study.trial_id,
-            title=api_study.title,
-            status=api_study.trial_status,
-            source="EU CTIS (MOCK)",
-            raw=entry,
-        )
-        yield unified_study
+
+    yield from _MOCK_STUDIES[:limit]
 
 
 # --- Alternatywna implementacja używająca EU Clinical Trials Register ---
@@ -170,7 +168,7 @@ def get_trials(condition: str, limit: int = 100) -> Iterator[UnifiedStudy]:
                 break
             
             # Parsujemy i walidujemy dane z API
-            api_study = CtisApiStudy.model_validate(entry)
+            api_study = msgspec.convert(entry, CtisApiStudy)
 
             # Mapujemy na nasz ujednolicony model
             unified_study = UnifiedStudy(
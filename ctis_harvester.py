@@ -1,8 +1,11 @@
-import os, asyncio, time, pendulum, boto3, hashlib
+# boto3 (~200 ms, 15 MB) i playwright importujemy leniwie w funkcjach,
+# które ich używają - zimny start Lambdy nie płaci za nie, gdy HeadObject
+# trafi w cache; hashlib był nieużywany, pendulum zastąpił stdlib
+import os, asyncio, httpx
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
-from playwright.async_api import async_playwright
 
 load_dotenv()
 
@@ -14,19 +17,64 @@ SEARCH_URL = (
     "https://euclinicaltrials.eu/search-for-clinical-trials"
 )
 
+# Szablon URL-a CSV podejrzany przy pierwszym scrape - kolejne przebiegi
+# pobierają plik zwykłym GET-em zamiast podnosić całe Chromium.
+URL_TMPL_PATH = Path("/tmp/ctis_url.tmpl")
+URL_TMPL_S3_KEY = "config/ctis_url.tmpl"
+
+# Stan kontekstu (cookies itd.) z poprzedniego przebiegu - wczytany przy
+# starcie omija modal cookie-consent i część bootstrapu SPA (~2-5 s)
+STATE_PATH = Path("/tmp/ctis_state.json")
+
 # ---------- helpers ----------
 
+def _yesterday():
+    """Wczorajsza data (UTC) - stdlib zamiast pendulum."""
+    return datetime.now(timezone.utc).date() - timedelta(days=1)
+
 def today_path() -> Path:
-    ts = pendulum.yesterday().format("YYYY-MM-DD")
+    ts = _yesterday().isoformat()
     # Lambda ma dostęp do /tmp
     tmp = Path("/tmp") / f"ctis_{ts}.csv"
     tmp.parent.mkdir(exist_ok=True, parents=True)
     return tmp
 
-def upload_to_s3(local_path: Path) -> str:
-    s3 = boto3.client("s3", region_name=REGION)
+# Jeden klient S3 na proces - konstrukcja klienta botocore (parsowanie
+# endpointów itd.) kosztuje ~50-100 ms i nie ma powodu płacić jej przy
+# każdym wywołaniu; większa pula połączeń obsługuje części multipart
+_S3 = None
+_TRANSFER_CONFIG = None
+
+def _get_s3():
+    global _S3, _TRANSFER_CONFIG
+    if _S3 is None:
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        _S3 = boto3.client(
+            "s3",
+            region_name=REGION,
+            config=Config(
+                max_pool_connections=32,
+                tcp_keepalive=True,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+        # Równoległe części po 8 MiB - kilka połączeń TCP wysyca pasmo ENI
+        # Lambdy, a pliki poniżej progu idą nadal jednym PUT-em.
+        _TRANSFER_CONFIG = TransferConfig(
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=8 * 1024 * 1024,
+            max_concurrency=8,
+            use_threads=True,
+        )
+    return _S3
+
+def _upload_to_s3_sync(local_path: Path) -> str:
+    s3 = _get_s3()
     key = f"raw/{local_path.name}"
-    s3.upload_file(str(local_path), S3_BUCKET, key)
+    s3.upload_file(str(local_path), S3_BUCKET, key, Config=_TRANSFER_CONFIG)
     # 7-dniowy presigned URL (na potrzeby debugowania)
     return s3.generate_presigned_url(
         "get_object",
@@ -34,52 +82,251 @@ def upload_to_s3(local_path: Path) -> str:
         ExpiresIn=7 * 24 * 3600,
     )
 
+async def upload_to_s3(local_path: Path) -> str:
+    # boto3 jest synchroniczne - PUT w wątku, żeby nie blokować pętli
+    # asyncio (i kanału IPC Playwrighta) na czas całego uploadu
+    return await asyncio.to_thread(_upload_to_s3_sync, local_path)
+
+def _s3_csv_ready(key: str):
+    """Presigned URL, jeśli wczorajszy CSV już leży w S3 (None gdy go brak).
+
+    /tmp nie przeżywa zimnego startu Lambdy, więc lokalny `exists()` nie
+    chroni przed ponownym scrape'em - HeadObject tak, i oszczędza cały
+    start Playwrighta (~30 s + ~200 MB RAM) przy retry/re-invoke.
+    """
+    if not S3_BUCKET:
+        return None
+    from botocore.exceptions import ClientError
+
+    s3 = _get_s3()
+    try:
+        s3.head_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            return None
+        raise
+    return s3.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": S3_BUCKET, "Key": key},
+        ExpiresIn=7 * 24 * 3600,
+    )
+
+def _save_url_template(url: str) -> None:
+    """Zapamiętuje URL CSV z datą zamienioną na placeholder.
+
+    Szablon zapisujemy tylko, gdy faktycznie coś podmieniliśmy - URL bez
+    placeholdera wskazywałby na zawsze wczorajszy dataset i każdy kolejny
+    przebieg zapisywałby go pod nową datą.
+    """
+    y = _yesterday()
+    dmy = y.strftime("%d/%m/%Y")
+    tmpl = (
+        url.replace(y.isoformat(), "{date}")
+        .replace(dmy, "{date_dmy}")
+        # w query stringu data bywa percent-encoded (%2F zamiast /)
+        .replace(dmy.replace("/", "%2F"), "{date_dmy_enc}")
+    )
+    if tmpl == url:
+        print("⚠ W URL-u CSV nie znaleziono wczorajszej daty - pomijam szablon")
+        return
+    URL_TMPL_PATH.write_text(tmpl)
+    if S3_BUCKET:
+        try:
+            _get_s3().put_object(Bucket=S3_BUCKET, Key=URL_TMPL_S3_KEY, Body=tmpl.encode())
+        except Exception as e:
+            print(f"⚠ Nie udało się zapisać szablonu URL do S3: {e}")
+
+def _load_url_template():
+    """Wczytuje szablon URL-a CSV z /tmp albo S3 (None gdy jeszcze go nie ma)."""
+    if URL_TMPL_PATH.exists():
+        return URL_TMPL_PATH.read_text().strip()
+    if S3_BUCKET:
+        try:
+            obj = _get_s3().get_object(Bucket=S3_BUCKET, Key=URL_TMPL_S3_KEY)
+            tmpl = obj["Body"].read().decode().strip()
+            URL_TMPL_PATH.write_text(tmpl)
+            return tmpl
+        except Exception:
+            return None
+    return None
+
+async def _fetch_csv_direct(url: str, out_path: Path) -> bool:
+    """Pobiera CSV bezpośrednim GET-em, strumieniując na dysk.
+
+    Jedno żądanie HTTP zamiast ~100 MB procesu Chromium; fallback na
+    Playwright następuje, gdy szablon URL-a przestanie działać.
+    """
+    try:
+        async with httpx.AsyncClient(
+            http2=True, timeout=DOWNLOAD_TIMEOUT, follow_redirects=True
+        ) as client:
+            async with client.stream("GET", url) as r:
+                r.raise_for_status()
+                # GET na nieaktualny szablon potrafi zwrócić 200 z HTML-em
+                # (redirect na stronę wyszukiwarki) - nie zapisujemy tego
+                # jako CSV
+                ctype = r.headers.get("content-type", "")
+                if "html" in ctype:
+                    raise ValueError(f"content-type {ctype!r} zamiast CSV")
+                first = True
+                with open(out_path, "wb") as f:
+                    async for chunk in r.aiter_bytes(1 << 20):
+                        if first:
+                            if chunk.lstrip()[:1] == b"<":
+                                raise ValueError("payload wygląda na HTML, nie CSV")
+                            first = False
+                        f.write(chunk)
+        return True
+    except (httpx.HTTPError, OSError, ValueError) as e:
+        print(f"⚠ Bezpośrednie pobranie nie powiodło się ({e}), fallback na Playwright")
+        out_path.unlink(missing_ok=True)
+        return False
+
+# ---------- browser (współdzielony między wywołaniami) ----------
+
+_pw = None
+_browser = None
+
+async def _get_browser():
+    """Zwraca współdzielony Browser, startując Chromium tylko raz na proces.
+
+    Na ciepłych wywołaniach Lambdy oszczędza to 1-3 s bootstrapu drivera
+    Playwright + startu Chromium; per przebieg tworzymy jedynie świeży
+    BrowserContext.
+    """
+    global _pw, _browser
+    if _browser is None or not _browser.is_connected():
+        # Sonda wymagań systemowych to setki ms - na obrazie Lambdy
+        # środowisko i tak jest znane; CHROMIUM_PATH omija discovery
+        os.environ.setdefault("PLAYWRIGHT_SKIP_VALIDATE_HOST_REQUIREMENTS", "1")
+        from playwright.async_api import async_playwright
+
+        _pw = await async_playwright().start()
+        _browser = await _pw.chromium.launch(
+            headless=True,
+            executable_path=os.getenv("CHROMIUM_PATH"),
+            args=[
+                "--no-sandbox",
+                "--disable-dev-shm-usage",
+                "--disable-gpu",
+                # Wyłącz ruch w tle (sync, variations, safe-browsing) -
+                # zbędne fetch'e kosztują pasmo i CPU na starcie
+                "--disable-background-networking",
+                "--disable-component-update",
+                "--disable-default-apps",
+                "--disable-sync",
+                "--metrics-recording-only",
+                "--no-first-run",
+                "--safebrowsing-disable-auto-update",
+                "--disable-breakpad",
+                "--disable-blink-features=AutomationControlled",
+            ],
+        )
+    return _browser
+
+async def close_browser():
+    """Zamyka współdzielony browser (koniec procesu / shutdown kontenera)."""
+    global _pw, _browser
+    if _browser is not None:
+        await _browser.close()
+        _browser = None
+    if _pw is not None:
+        await _pw.stop()
+        _pw = None
+
 # ---------- core ----------
 
 @retry(wait=wait_exponential(multiplier=2, min=4, max=30),
        stop=stop_after_attempt(3))
 async def run():
     out_path = today_path()
+    # Idempotencja: jeśli plik już jest w S3, nie dotykamy przeglądarki
+    s3_url = await asyncio.to_thread(_s3_csv_ready, f"raw/{out_path.name}")
+    if s3_url:
+        print("✔ CSV już w S3 - pomijam pobieranie.")
+        return s3_url
     if out_path.exists():
         print("✔ CSV już pobrany.")
-        return upload_to_s3(out_path)
+        return await upload_to_s3(out_path)
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        ctx = await browser.new_context(accept_downloads=True)
-        page = await ctx.new_page()
+    # Jeśli znamy już URL CSV z poprzedniego scrape'u, próbujemy zwykłego GET-a
+    tmpl = _load_url_template()
+    if tmpl:
+        y = _yesterday()
+        dmy = y.strftime("%d/%m/%Y")
+        direct_url = (
+            tmpl.replace("{date}", y.isoformat())
+            .replace("{date_dmy}", dmy)
+            .replace("{date_dmy_enc}", dmy.replace("/", "%2F"))
+        )
+        if await _fetch_csv_direct(direct_url, out_path):
+            print(f"✔ Zapisano {out_path}  ({out_path.stat().st_size/1e6:.1f} MB) [direct GET]")
+            return await upload_to_s3(out_path)
 
-        # Interceptujemy wszystkie żądania, by wychwycić link CSV
-        download_url = None
-        def handle_request(request):
-            nonlocal download_url
-            url = request.url
-            if "download" in url and url.endswith(".csv"):
-                download_url = url
-        page.on("request", handle_request)
+    browser = await _get_browser()
+    ctx = await browser.new_context(
+        accept_downloads=True,
+        storage_state=str(STATE_PATH) if STATE_PATH.exists() else None,
+    )
+    try:
+        # Scrape potrzebuje tylko DOM-u i endpointu CSV - obrazki, fonty,
+        # style i analityka to zbędne bajty oraz IPC do drivera Playwright
+        async def _route(route, req):
+            if req.resource_type in ("image", "font", "media", "stylesheet"):
+                return await route.abort()
+            if any(d in req.url for d in ("google-analytics", "gtag", "hotjar", "matomo")):
+                return await route.abort()
+            await route.continue_()
+        await ctx.route("**/*", _route)
+
+        page = await ctx.new_page()
 
-        await page.goto(SEARCH_URL, timeout=60000)
+        # domcontentloaded zamiast pełnego load - CTIS trzyma beacony
+        # analityczne przy życiu i networkidle/load potrafi wisieć sekundami
+        await page.goto(SEARCH_URL, wait_until="domcontentloaded", timeout=30000)
         # 1) otwórz filtr advanced
         await page.locator("button:has-text('Advanced filters')").click()
         # 2) ustaw "Last updated" na wczoraj
         await page.locator("label:has-text('Last updated')").click()
-        yesterday = pendulum.yesterday().format("DD/MM/YYYY")
+        yesterday = _yesterday().strftime("%d/%m/%Y")
         input_box = page.locator("input[placeholder='DD/MM/YYYY']").first
         await input_box.fill(yesterday)
         await input_box.press("Enter")
-        # 3) kliknij Download CSV
-        with page.expect_download(timeout=DOWNLOAD_TIMEOUT * 1000) as dl_info:
+        # 3) kliknij Download CSV; URL bierzemy z obiektu Download -
+        # bez nasłuchiwania page.on("request") dla setek żądań strony
+        # i bez wiązania sukcesu przebiegu z predykatem na URL-u
+        async with page.expect_download(timeout=DOWNLOAD_TIMEOUT * 1000) as dl_info:
             await page.locator("button:has-text('Download CSV')").click()
         download = await dl_info.value
-        csv_path = await download.path()
-        Path(csv_path).rename(out_path)
-        await browser.close()
+        download_url = download.url
+        # save_as strumieniuje prosto do celu zamiast path()+rename przez
+        # katalog tymczasowy (między systemami plików to pełna kopia)
+        await download.save_as(out_path)
+        # Upload startuje od razu - zamknięcie kontekstu (~0.5 s) i PUT do
+        # S3 są niezależne, więc nakładamy je na siebie
+        upload_task = asyncio.create_task(upload_to_s3(out_path))
+        if download_url:
+            _save_url_template(download_url)
+        # Zapamiętaj cookies/stan sesji - kolejny przebieg nie zobaczy
+        # modala cookie-consent
+        try:
+            await ctx.storage_state(path=str(STATE_PATH))
+        except Exception as e:
+            print(f"⚠ Nie udało się zapisać stanu kontekstu: {e}")
+    finally:
+        await ctx.close()
 
     print(f"✔ Zapisano {out_path}  ({out_path.stat().st_size/1e6:.1f} MB)")
-    return upload_to_s3(out_path)
+    return await upload_task
 
 # ---------- entry ----------
 
 if __name__ == "__main__":
-    url = asyncio.run(run())
+    async def _main():
+        try:
+            return await run()
+        finally:
+            await close_browser()
+
+    url = asyncio.run(_main())
     print("Presigned URL (debug):", url)
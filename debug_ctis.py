@@ -15,18 +15,29 @@ async def debug_ctis_page():
         
         try:
             print("🌐 Nawigacja do EU CTIS...")
-            await page.goto("https://euclinicaltrials.eu/search-for-clinical-trials", timeout=60000)
-            
+            # domcontentloaded + jawne czekanie na elementy zamiast networkidle
+            # i sztywnych sleepów - beacony analityczne CTIS nie pozwalają
+            # networkidle nigdy szybko się zakończyć
+            await page.goto(
+                "https://euclinicaltrials.eu/search-for-clinical-trials",
+                wait_until="domcontentloaded",
+                timeout=30000,
+            )
+
             print("🍪 Obsługa cookies...")
             accept_cookies = page.locator("button:has-text('Accept all cookies')")
             if await accept_cookies.count() > 0:
                 await accept_cookies.click()
                 print("   ✔ Cookies zaakceptowane")
-                await asyncio.sleep(5)  # Dłuższe czekanie
-            
-            print("⏳ Czekanie na pełne załadowanie...")
-            await page.wait_for_load_state("networkidle")
-            await asyncio.sleep(3)
+                await accept_cookies.wait_for(state="detached", timeout=10000)
+
+            print("⏳ Czekanie na załadowanie interfejsu...")
+            try:
+                await page.locator("button:has-text('Advanced filters')").wait_for(
+                    state="visible", timeout=10000
+                )
+            except Exception:
+                print("   ⚠ Przycisk 'Advanced filters' nie pojawił się w 10 s")
             
             print("📄 Analiza struktury strony...")
             
@@ -46,35 +57,37 @@ async def debug_ctis_page():
             forms = await page.locator("form").count()
             print(f"   Formularze: {forms}")
             
-            # Sprawdź wszystkie przyciski
+            # Każdy blok enumeracji to jeden page.evaluate - pojedynczy
+            # round-trip do przeglądarki zamiast await per element (strona
+            # z tysiącami węzłów robiła to minutami)
             print("🔘 Wszystkie przyciski na stronie:")
-            buttons = await page.locator("button").all()
-            for i, btn in enumerate(buttons):
-                text = await btn.inner_text()
-                visible = await btn.is_visible()
-                if visible and text.strip():
-                    print(f"     {i}: '{text.strip()}'")
-            
+            buttons = await page.evaluate("""() =>
+                Array.from(document.querySelectorAll('button'))
+                    .filter(el => el.checkVisibility() && (el.innerText||'').trim())
+                    .map(el => (el.innerText||'').trim())""")
+            print("\n".join(f"     {i}: '{text}'" for i, text in enumerate(buttons)))
+
             # Sprawdź wszystkie pola input
             print("📝 Wszystkie pola input:")
-            inputs = await page.locator("input").all()
-            for i, inp in enumerate(inputs):
-                visible = await inp.is_visible()
-                if visible:
-                    input_type = await inp.get_attribute("type")
-                    placeholder = await inp.get_attribute("placeholder")
-                    name = await inp.get_attribute("name")
-                    print(f"     {i}: type='{input_type}' name='{name}' placeholder='{placeholder}'")
-            
-            # Sprawdź wszystkie linki z "download"
+            inputs = await page.evaluate("""() =>
+                Array.from(document.querySelectorAll('input'))
+                    .filter(el => el.checkVisibility())
+                    .map(el => ({type: el.type, name: el.name, placeholder: el.placeholder}))""")
+            print("\n".join(
+                f"     {i}: type='{inp['type']}' name='{inp['name']}' placeholder='{inp['placeholder']}'"
+                for i, inp in enumerate(inputs)
+            ))
+
+            # Sprawdź wszystkie elementy z "download"
             print("🔗 Linki związane z download:")
-            all_elements = await page.locator("*").all()
-            download_elements = []
-            for elem in all_elements:
-                text = await elem.inner_text()
-                if "download" in text.lower():
-                    tag = await elem.evaluate("el => el.tagName")
-                    print(f"     {tag}: '{text.strip()}'")
+            download_elements = await page.evaluate("""() =>
+                Array.from(document.querySelectorAll('*'))
+                    .filter(el => (el.innerText||'').toLowerCase().includes('download'))
+                    .map(el => ({tag: el.tagName,
+                                 text: (el.innerText||'').trim().slice(0, 200)}))""")
+            print("\n".join(
+                f"     {d['tag']}: '{d['text']}'" for d in download_elements
+            ))
             
             # Sprawdź czy są jakieś loading spinnery
             loading = await page.locator(".loading, .spinner, [aria-label*='loading']").count()
@@ -84,10 +97,6 @@ async def debug_ctis_page():
             await page.screenshot(path="ctis_debug.png")
             print("📸 Screenshot zapisany: ctis_debug.png")
             
-            # Czekaj 10 sekund żeby użytkownik mógł zobaczyć stronę
-            print("⏱️  Czekanie 10 sekund na manualną inspekcję...")
-            await asyncio.sleep(10)
-            
         except Exception as e:
             print(f"❌ Błąd: {e}")
             await page.screenshot(path="ctis_error.png")
@@ -9,6 +9,27 @@ import os
 from datetime import datetime
 from ctis_harvester import run
 
+# uvloop (libuv) obsługuje socket-heavy workloady 2-4x szybciej niż
+# domyślna pętla - a tu przez sockety idzie i IPC Playwrighta, i S3.
+# Na Windows/braku pakietu zostajemy przy pętli domyślnej.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+# Trwały event loop na cały proces - asyncio.run tworzyłby i zamykał pętlę
+# per wywołanie, zabijając współdzielony browser z ctis_harvester na
+# ciepłych wywołaniach Lambdy.
+_loop = None
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
 def lambda_handler(event, context):
     """
     AWS Lambda entry point for CTIS harvester.
@@ -25,8 +46,8 @@ def lambda_handler(event, context):
     print(f"Event: {json.dumps(event, default=str)}")
     
     try:
-        # Uruchom harvester asynchronicznie
-        result = asyncio.run(run())
+        # Uruchom harvester asynchronicznie (na trwałej pętli)
+        result = _get_loop().run_until_complete(run())
         
         response = {
             'statusCode': 200,
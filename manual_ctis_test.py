@@ -4,6 +4,7 @@ Prosty test ręcznej nawigacji do EU CTIS.
 """
 
 import asyncio
+import signal
 from playwright.async_api import async_playwright
 
 async def manual_ctis_test():
@@ -30,7 +31,8 @@ async def manual_ctis_test():
                 if await cookies_btn.is_visible(timeout=5000):
                     await cookies_btn.click()
                     print("🍪 Cookies zaakceptowane")
-                    await asyncio.sleep(3)
+                    # Czekamy aż banner faktycznie zniknie zamiast sztywnego sleepa
+                    await cookies_btn.wait_for(state="detached", timeout=5000)
             except:
                 print("⚠️  Brak cookie banner lub już zaakceptowane")
             
@@ -76,12 +78,22 @@ async def manual_ctis_test():
             print("5. Naciśnij Ctrl+C w terminalu gdy skończysz")
             print("="*50)
             
-            # Poczekaj na input użytkownika
+            # Poczekaj na Ctrl+C - Event zamiast pętli sleep(1), zero
+            # wybudzeń pętli zdarzeń podczas długiej sesji manualnej
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop.set)
+                except NotImplementedError:
+                    pass  # Windows
             try:
-                while True:
-                    await asyncio.sleep(1)
+                await stop.wait()
             except KeyboardInterrupt:
-                print("\n👋 Zamykanie przeglądarki...")
+                # Windows: bez add_signal_handler Ctrl+C wpada tutaj
+                # jako KeyboardInterrupt - też kończymy po dobroci
+                pass
+            print("\n👋 Zamykanie przeglądarki...")
                 
         except Exception as e:
             print(f"❌ Błąd: {e}")
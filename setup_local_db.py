@@ -1,22 +1,27 @@
 #!/usr/bin/env python3
 # setup_local_db.py - Szybka konfiguracja lokalnej bazy
 
+import asyncio
 import psycopg
-import os
 
 def setup_local_sqlite():
     """Konfiguracja SQLite dla szybkiego startu"""
     print("🔧 Konfiguracja SQLite dla rozwoju...")
-    
-    # Instalacja SQLite adapter
-    os.system(".venv\\Scripts\\pip install sqlite3")
-    
-    # Utworzenie lokalnej bazy SQLite
+
+    # Utworzenie lokalnej bazy SQLite (sqlite3 jest w stdlib)
     import sqlite3
     
-    conn = sqlite3.connect('trialwatch.db')
+    # isolation_level=None: transakcjami sterujemy sami (BEGIN/COMMIT)
+    conn = sqlite3.connect('trialwatch.db', isolation_level=None)
     cursor = conn.cursor()
-    
+
+    # WAL nie robi fsync przy każdym commicie; reszta pragm ogranicza I/O
+    # gdy baza urośnie ponad te kilka testowych wierszy
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+
     # Podstawowa tabela dla testów
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS trials (
@@ -28,14 +33,21 @@ def setup_local_sqlite():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
-    # Test insert
-    cursor.execute('''
-        INSERT OR IGNORE INTO trials (id, title, status, source) 
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_trials_source ON trials(source)"
+    )
+
+    # Test insert - jedna transakcja + executemany, żeby przyszłe batche
+    # nie płaciły fsync/commit per wiersz
+    test_rows = [
+        ('NCT123456', 'Test Trial', 'RECRUITING', 'ClinicalTrials.gov'),
+    ]
+    cursor.execute("BEGIN")
+    cursor.executemany('''
+        INSERT OR IGNORE INTO trials (id, title, status, source)
         VALUES (?, ?, ?, ?)
-    ''', ('NCT123456', 'Test Trial', 'RECRUITING', 'ClinicalTrials.gov'))
-    
-    conn.commit()
+    ''', test_rows)
+    cursor.execute("COMMIT")
     
     # Test select
     cursor.execute('SELECT * FROM trials')
@@ -51,38 +63,59 @@ def setup_local_sqlite():
     
     return "sqlite:///./trialwatch.db"
 
-def test_postgresql_variants():
-    """Test różnych wariantów PostgreSQL connection string"""
-    
+async def _probe_postgresql(host: str, port: int, password: str):
+    """Próbuje pojedynczego połączenia; zwraca conn_string przy sukcesie."""
+    conn_string = f"postgresql://postgres:{password}@{host}:{port}/railway"
+    async with await psycopg.AsyncConnection.connect(
+        conn_string, connect_timeout=3
+    ) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT version();")
+            version = (await cur.fetchone())[0]
+            print(f"✅ SUKCES! {conn_string}")
+            print(f"Version: {version[:50]}...")
+            return conn_string
+
+async def _sweep_postgresql_variants():
     # Możliwe hosty Railway
     possible_hosts = [
         "containers-us-west-201.railway.app",
-        "postgres.railway.internal", 
+        "postgres.railway.internal",
         f"postgres-production-{hash('railway') % 10000}.up.railway.app",
         f"database.railway.app"
     ]
-    
+
     password = "fjDBNaPGgXxUrQbfTFetxJgrKfjnzPGG"
-    
-    print("🔍 Testowanie możliwych Railway hostów...")
-    
-    for host in possible_hosts:
-        for port in [5432, 7000, 6543]:
-            conn_string = f"postgresql://postgres:{password}@{host}:{port}/railway"
-            print(f"\n🧪 Test: {host}:{port}")
-            
+
+    print("🔍 Testowanie możliwych Railway hostów (równolegle)...")
+
+    # Wszystkie kombinacje host×port naraz - sekwencyjnie to 12 prób po
+    # 3 s timeoutu (~36 s w najgorszym razie), równolegle ~3 s
+    tasks = {
+        asyncio.create_task(_probe_postgresql(host, port, password)): (host, port)
+        for host in possible_hosts
+        for port in [5432, 7000, 6543]
+    }
+    pending = set(tasks)
+    conn_string = None
+    while pending and conn_string is None:
+        done, pending = await asyncio.wait(
+            pending, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            host, port = tasks[task]
             try:
-                with psycopg.connect(conn_string, connect_timeout=3) as conn:
-                    with conn.cursor() as cur:
-                        cur.execute("SELECT version();")
-                        version = cur.fetchone()[0]
-                        print(f"✅ SUKCES! {conn_string}")
-                        print(f"Version: {version[:50]}...")
-                        return conn_string
+                conn_string = task.result()
             except Exception as e:
-                print(f"❌ {type(e).__name__}: {str(e)[:50]}...")
-    
-    return None
+                print(f"❌ {host}:{port} - {type(e).__name__}: {str(e)[:50]}...")
+
+    for task in pending:
+        task.cancel()
+    return conn_string
+
+def test_postgresql_variants():
+    """Test różnych wariantów PostgreSQL connection string"""
+    return asyncio.run(_sweep_postgresql_variants())
 
 def main():
     print("🚀 Setup lokalnej bazy danych dla trialwatch")
@@ -4,179 +4,446 @@ Test skryptu ctis_harvester.py bez AWS S3.
 Pobiera CSV z EU CTIS i zapisuje lokalnie.
 """
 
-import os, asyncio, time, pendulum
+import functools
+import json
+import os, asyncio
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
-from playwright.async_api import async_playwright
 
 load_dotenv()
 
 DOWNLOAD_TIMEOUT = int(os.getenv("DOWNLOAD_TIMEOUT", "90"))
 SEARCH_URL = "https://euclinicaltrials.eu/search-for-clinical-trials"
 
+# Katalog tworzymy raz przy imporcie, nie mkdir-em przy każdym wywołaniu
+DOWNLOADS_DIR = Path("./downloads")
+DOWNLOADS_DIR.mkdir(exist_ok=True, parents=True)
+
+# Listy selektorów jako stałe modułu - jedna alokacja zamiast świeżych
+# list przy każdym wywołaniu
+_ALT_SEL = (
+    "button[data-test='advanced-filters']",
+    "button[aria-label*='advanced']",
+    ".advanced-filters button",
+    "[data-cy*='advanced'] button",
+)
+_DATE_SEL = (
+    "input[placeholder='DD/MM/YYYY']",
+    "input[type='date']",
+    "input[placeholder*='date']",
+    ".date-picker input",
+)
+_DOWNLOAD_SEL = (
+    "button:has-text('Download CSV')",
+    "button:has-text('Download')",
+    "a:has-text('Download CSV')",
+    "[data-test*='download'] button",
+    ".download-csv",
+    ".export-csv",
+)
+
+# Ostatnie działające selektory z poprzednich przebiegów - trafiony wpis
+# pomija całą pętlę sondowania alternatyw
+_SELECTOR_CACHE_PATH = DOWNLOADS_DIR / ".selector_cache.json"
+
+def _load_selector_cache() -> dict:
+    try:
+        return json.loads(_SELECTOR_CACHE_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def _save_selector_cache(cache: dict) -> None:
+    try:
+        _SELECTOR_CACHE_PATH.write_text(json.dumps(cache))
+    except OSError:
+        pass
+
+# Szablon URL-a CSV z ostatniego udanego pobrania - trafiony wpis pozwala
+# ściągnąć plik zwykłym GET-em, bez podnoszenia Chromium
+_URL_TMPL_PATH = DOWNLOADS_DIR / ".ctis_url"
+
+def _yesterday() -> date:
+    """Wczorajsza data - stdlib zamiast pendulum (bez tz-daty na starcie)."""
+    return date.today() - timedelta(days=1)
+
+@functools.lru_cache(maxsize=1)
 def today_path() -> Path:
-    """Ścieżka do pliku CSV z dzisiejszą datą."""
-    ts = pendulum.yesterday().format("YYYY-MM-DD")
-    tmp = Path("./downloads") / f"ctis_{ts}.csv"
-    tmp.parent.mkdir(exist_ok=True, parents=True)
-    return tmp
+    """Ścieżka do pliku CSV z dzisiejszą datą (liczona raz na proces)."""
+    return DOWNLOADS_DIR / f"ctis_{_yesterday().isoformat()}.csv"
+
+def _save_url_template(url: str) -> None:
+    """Zapamiętuje URL CSV z datą zamienioną na placeholder.
+
+    Szablon zapisujemy tylko, gdy faktycznie coś podmieniliśmy - URL bez
+    placeholdera kodowałby na stałe wczorajszy filtr dat i kolejne dni
+    pobierałyby stary zakres pod nową nazwą pliku.
+    """
+    y = _yesterday()
+    dmy = y.strftime("%d/%m/%Y")
+    tmpl = (
+        url.replace(y.isoformat(), "{date}")
+        .replace(dmy, "{date_dmy}")
+        # w query stringu data bywa percent-encoded (%2F zamiast /)
+        .replace(dmy.replace("/", "%2F"), "{date_dmy_enc}")
+    )
+    if tmpl == url:
+        print("⚠ W URL-u CSV nie znaleziono wczorajszej daty - pomijam szablon")
+        return
+    _URL_TMPL_PATH.write_text(tmpl)
+
+def _direct_url_from_template() -> str | None:
+    """Szablon z poprzedniego przebiegu z podstawioną bieżącą datą."""
+    try:
+        tmpl = _URL_TMPL_PATH.read_text().strip()
+    except OSError:
+        return None
+    if not tmpl:
+        return None
+    y = _yesterday()
+    dmy = y.strftime("%d/%m/%Y")
+    return (
+        tmpl.replace("{date}", y.isoformat())
+        .replace("{date_dmy}", dmy)
+        .replace("{date_dmy_enc}", dmy.replace("/", "%2F"))
+    )
+
+async def _fetch_csv_direct(url: str, out_path: Path) -> bool:
+    """Pobiera CSV zwykłym GET-em, bez udziału przeglądarki.
+
+    URL znamy z poprzedniego przebiegu Playwrighta - sam transfer nie
+    potrzebuje Chromium i leci z prędkością klienta HTTP.
+    """
+    import httpx
+
+    try:
+        async with httpx.AsyncClient(
+            timeout=DOWNLOAD_TIMEOUT, follow_redirects=True
+        ) as client:
+            async with client.stream("GET", url) as r:
+                r.raise_for_status()
+                # GET na nieaktualny szablon potrafi zwrócić 200 z HTML-em
+                # (redirect na stronę wyszukiwarki) - nie zapisujemy tego
+                # jako CSV
+                ctype = r.headers.get("content-type", "")
+                if "html" in ctype:
+                    raise ValueError(f"content-type {ctype!r} zamiast CSV")
+                first = True
+                with open(out_path, "wb") as f:
+                    async for chunk in r.aiter_bytes(1 << 20):
+                        if first:
+                            if chunk.lstrip()[:1] == b"<":
+                                raise ValueError("payload wygląda na HTML, nie CSV")
+                            first = False
+                        f.write(chunk)
+        return True
+    except (httpx.HTTPError, OSError, ValueError) as e:
+        print(f"⚠ Bezpośredni GET nie powiódł się ({e}), fallback na Playwright")
+        out_path.unlink(missing_ok=True)
+        return False
+
+async def _count_all(page, selectors):
+    """Liczy dopasowania wielu selektorów CSS jednym evaluate.
+
+    Jeden Runtime.evaluate na całą listę zamiast osobnego count() (i
+    serializacji) per selektor; selektory z playwrightowym :has-text()
+    nie są poprawnym CSS i muszą zostać na API locatorów.
+    """
+    return await page.evaluate(
+        "sels => sels.map(s => document.querySelectorAll(s).length)",
+        list(selectors),
+    )
 
 @retry(wait=wait_exponential(multiplier=2, min=4, max=30),
        stop=stop_after_attempt(3))
+async def _trigger_download(page, download_btn, out_path: Path, done_marker: Path):
+    """Samo kliknięcie + oczekiwanie na plik - jedyny retry'owany krok.
+
+    Timeout downloadu nie powinien wymuszać powtórki cookies, filtrów
+    i sond selektorów (~10-30 s UI primingu per próba).
+    """
+    # Przy ponownej próbie DOM mógł się przesunąć
+    await download_btn.scroll_into_view_if_needed()
+    async with page.expect_download(timeout=DOWNLOAD_TIMEOUT * 1000) as dl_info:
+        await download_btn.click()
+        print("⏳ Oczekiwanie na download...")
+
+    download = await dl_info.value
+    # save_as strumieniuje prosto do celu - bez czekania na pełny
+    # zapis do katalogu tymczasowego i przenoszenia (które między
+    # systemami plików robi się kopią)
+    await download.save_as(out_path)
+    done_marker.touch()
+    # Zapamiętaj szablon URL-a - następny przebieg spróbuje GET-a bez
+    # podnoszenia Chromium
+    _save_url_template(download.url)
+
+async def _do_harvest(ctx, out_path: Path, done_marker: Path):
+    """Jedna próba pobrania CSV na istniejącym kontekście przeglądarki."""
+    sel_cache = _load_selector_cache()
+    page = await ctx.new_page()
+    # Krótkie domyślne timeouty: nietrafiony selektor ma polec w 5 s,
+    # a nie wisieć 30; zawieszona próba kończy się w ~25 s i retry
+    # tenacity faktycznie ma kiedy zadziałać. Dłuższe limity dostają
+    # jawnie tylko goto i expect_download.
+    page.set_default_timeout(5000)
+    page.set_default_navigation_timeout(20000)
+
+    try:
+        await page.goto(SEARCH_URL, timeout=20000)
+        print("✔ Strona załadowana")
+
+        # Sprawdź czy strona się załadowała poprawnie
+        title = await page.title()
+        print(f"   Tytuł strony: {title}")
+
+        # Zaakceptuj cookies jeśli są
+        accept_cookies = page.locator("button:has-text('Accept all cookies')")
+        if await accept_cookies.count() > 0:
+            print("🍪 Akceptowanie cookies...")
+            await accept_cookies.click()
+            # Czekamy aż banner zniknie zamiast sztywnych 3 s
+            await accept_cookies.wait_for(state="detached", timeout=5000)
+
+        # Poczekaj na załadowanie strony po cookies - domcontentloaded
+        # zamiast networkidle, które przy keep-alive'ach CTIS potrafi
+        # wisieć sekundami albo nie odpalić wcale
+        await page.wait_for_load_state("domcontentloaded")
+
+        # Sprawdź czy przycisk Advanced filters istnieje - czekamy na
+        # konkretny element, którego faktycznie potrzebujemy
+        advanced_btn = page.locator("button:has-text('Advanced filters')")
+        try:
+            await advanced_btn.first.wait_for(state="visible", timeout=10000)
+            advanced_found = True
+        except Exception:
+            advanced_found = False
+
+        if advanced_found:
+            print("✔ Znaleziono przycisk 'Advanced filters'")
+            await advanced_btn.click()
+            # Panel filtrów jest gotowy, gdy pojawi się pole daty
+            try:
+                await page.locator(
+                    "input[placeholder='DD/MM/YYYY']"
+                ).first.wait_for(state="visible", timeout=5000)
+            except Exception:
+                pass  # fallback date_selectors niżej poradzi sobie sam
+        else:
+            print("⚠️  Nie znaleziono przycisku 'Advanced filters'")
+            print("   Szukanie alternatywnych selektorów...")
+
+            # Sprawdź inne możliwe selektory; najpierw ten, który
+            # zadziałał ostatnio
+            alt_selectors = _ALT_SEL
+
+            selector = sel_cache.get("advanced")
+            if selector and await page.locator(selector).count() == 0:
+                selector = None
+            if selector is None:
+                # Wszystkie selektory jednym evaluate - jeden round-trip
+                # zamiast count() per selektor
+                counts = await _count_all(page, alt_selectors)
+                selector = next(
+                    (s for s, c in zip(alt_selectors, counts) if c > 0), None
+                )
+            if selector:
+                if sel_cache.get("advanced") != selector:
+                    sel_cache["advanced"] = selector
+                    _save_selector_cache(sel_cache)
+                print(f"   ✔ Znaleziono alternatywny selektor: {selector}")
+                await page.locator(selector).click()
+                try:
+                    await page.locator(
+                        "input[placeholder='DD/MM/YYYY']"
+                    ).first.wait_for(state="visible", timeout=5000)
+                except Exception:
+                    pass
+            else:
+                print("   Dostępne przyciski na stronie:")
+                # Jeden eval_on_selector_all zamiast round-tripu per
+                # przycisk
+                button_texts = await page.eval_on_selector_all(
+                    "button",
+                    "els => els.slice(0, 10).map(e => e.innerText.trim())",
+                )
+                for i, text in enumerate(button_texts):
+                    if text:  # Tylko przyciski z tekstem
+                        print(f"     {i}: '{text}'")
+
+        # Sprawdź czy można ustawić datę
+        date_selectors = _DATE_SEL
+
+        date_selector = sel_cache.get("date")
+        if date_selector and await page.locator(date_selector).count() == 0:
+            date_selector = None
+        if date_selector is None:
+            date_counts = await _count_all(page, date_selectors)
+            date_selector = next(
+                (s for s, c in zip(date_selectors, date_counts) if c > 0), None
+            )
+        date_input = None
+        if date_selector:
+            if sel_cache.get("date") != date_selector:
+                sel_cache["date"] = date_selector
+                _save_selector_cache(sel_cache)
+            date_input = page.locator(date_selector).first
+            print(f"✔ Znaleziono pole daty: {date_selector}")
+
+        if date_input:
+            yesterday = _yesterday().strftime("%d/%m/%Y")
+            print(f"✔ Ustawianie daty: {yesterday}")
+            await date_input.fill(yesterday)
+            await date_input.press("Enter")
+            await asyncio.sleep(2)
+        else:
+            print("⚠️  Nie znaleziono pola daty")
+            print("   Dostępne pola input:")
+            inputs = await page.eval_on_selector_all(
+                "input",
+                "els => els.slice(0, 5).map(e => ({type: e.type, placeholder: e.placeholder}))",
+            )
+            for i, inp in enumerate(inputs):
+                print(f"     {i}: type='{inp['type']}' placeholder='{inp['placeholder']}'")
+
+        # Sprawdź czy przycisk Download CSV istnieje
+        download_selectors = _DOWNLOAD_SEL
+
+        download_selector = sel_cache.get("download")
+        if download_selector and await page.locator(download_selector).count() == 0:
+            download_selector = None
+        if download_selector is None:
+            # :has-text() to składnia Playwrighta, nie CSS - te selektory
+            # liczymy gatherem na locatorach, resztę jednym evaluate
+            text_sels = [s for s in download_selectors if ":has-text(" in s]
+            css_sels = [s for s in download_selectors if ":has-text(" not in s]
+            text_counts = await asyncio.gather(
+                *(page.locator(s).count() for s in text_sels)
+            )
+            css_counts = await _count_all(page, css_sels)
+            count_by_sel = dict(zip(text_sels, text_counts))
+            count_by_sel.update(zip(css_sels, css_counts))
+            download_selector = next(
+                (s for s in download_selectors if count_by_sel[s] > 0), None
+            )
+        download_btn = None
+        if download_selector:
+            if sel_cache.get("download") != download_selector:
+                sel_cache["download"] = download_selector
+                _save_selector_cache(sel_cache)
+            download_btn = page.locator(download_selector).first
+            print(f"✔ Znaleziono przycisk download: {download_selector}")
+
+        if download_btn:
+            print("🔄 Próba pobrania CSV...")
+            await _trigger_download(page, download_btn, out_path, done_marker)
+            print(f"✔ Zapisano: {out_path}")
+            print(f"   Rozmiar: {os.stat(out_path).st_size/1e6:.1f} MB")
+            return True
+
+        else:
+            print("⚠️  Nie znaleziono przycisku download")
+            print("   Wszystkie linki na stronie:")
+            links = await page.eval_on_selector_all(
+                "a",
+                "els => els.slice(0, 10).map(e => ({text: e.innerText.trim(), href: e.href}))",
+            )
+            for i, link in enumerate(links):
+                if "download" in (link["text"] + str(link["href"])).lower():
+                    print(f"     {i}: '{link['text']}' -> {link['href']}")
+
+    except Exception as e:
+        print(f"❌ Błąd: {e}")
+        # Screenshot tylko na życzenie - zrzut przez CDP to 200-500 ms
+        # przestoju pętli + kodowanie PNG, zbędne poza debugowaniem
+        if os.getenv("DEBUG_SCREENSHOT") == "1":
+            screenshot_path = f"debug_screenshot_{datetime.now().strftime('%H-%M-%S')}.png"
+            await page.screenshot(path=screenshot_path)
+            print(f"   Screenshot zapisany: {screenshot_path}")
+        raise
+
+    finally:
+        await page.close()
+
+    return False
+
 async def test_harvest():
     """Test harvestingu bez uploadu do S3."""
     out_path = today_path()
-    
-    if out_path.exists():
+    # Marker .done: ponowne wejścia kończą się na stat(), zanim w ogóle
+    # zaimportujemy playwright
+    done_marker = out_path.parent / f".{out_path.stem}.done"
+
+    if out_path.exists() and done_marker.exists():
         print(f"✔ CSV już istnieje: {out_path}")
         print(f"   Rozmiar: {out_path.stat().st_size/1e6:.1f} MB")
         return str(out_path)
 
+    # Znany szablon URL-a CSV z poprzedniego przebiegu? Spróbuj GET-a
+    # z podstawioną bieżącą datą
+    direct_url = _direct_url_from_template()
+    if direct_url:
+        if await _fetch_csv_direct(direct_url, out_path):
+            done_marker.touch()
+            print(f"✔ Zapisano: {out_path} [direct GET]")
+            print(f"   Rozmiar: {os.stat(out_path).st_size/1e6:.1f} MB")
+            return str(out_path)
+
     print(f"🌐 Otwieranie {SEARCH_URL}")
-    
+
+    # Import dopiero po chybieniu cache - playwright to ciężki pakiet,
+    # a trafienie w cache nie potrzebuje go wcale. Sondę wymagań
+    # systemowych pomijamy - na znanym środowisku to tylko setki ms
+    os.environ.setdefault("PLAYWRIGHT_SKIP_VALIDATE_HOST_REQUIREMENTS", "1")
+    from playwright.async_api import async_playwright
+
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)  # headless=False żeby zobaczyć
+        # Headless domyślnie - test pobiera CSV, nie ogląda UI; HEADLESS=0
+        # przywraca okno, gdy trzeba popatrzeć na stronę
+        browser = await p.chromium.launch(
+            headless=int(os.getenv("HEADLESS", "1")) == 1,
+            # CHROMIUM_PATH omija skanowanie katalogów z przeglądarkami
+            executable_path=os.getenv("CHROMIUM_PATH"),
+            args=[
+                "--disable-gpu",
+                "--no-sandbox",
+                "--disable-dev-shm-usage",
+                "--disable-extensions",
+                "--disable-popup-blocking",
+                # Wyłącz ruch w tle (sync, variations, safe-browsing) -
+                # to on potrafił podtrzymywać aktywność sieci po starcie
+                "--disable-background-networking",
+                "--disable-component-update",
+                "--disable-default-apps",
+                "--disable-sync",
+                "--metrics-recording-only",
+                "--no-first-run",
+                "--safebrowsing-disable-auto-update",
+                "--disable-breakpad",
+                "--disable-blink-features=AutomationControlled",
+            ],
+        )
         ctx = await browser.new_context(accept_downloads=True)
-        page = await ctx.new_page()
-
+        # Obrazki/fonty/media nie są potrzebne do kliknięcia w przycisk
+        # i pobrania CSV; style zostają, bo wait_for(state="visible")
+        # opiera się na widoczności liczonej z CSS
+        await ctx.route(
+            "**/*",
+            lambda route: route.abort()
+            if route.request.resource_type in {"image", "font", "media"}
+            else route.continue_(),
+        )
         try:
-            await page.goto(SEARCH_URL, timeout=60000)
-            print("✔ Strona załadowana")
-            
-            # Sprawdź czy strona się załadowała poprawnie
-            title = await page.title()
-            print(f"   Tytuł strony: {title}")
-            
-            # Zaakceptuj cookies jeśli są
-            accept_cookies = page.locator("button:has-text('Accept all cookies')")
-            if await accept_cookies.count() > 0:
-                print("🍪 Akceptowanie cookies...")
-                await accept_cookies.click()
-                await asyncio.sleep(3)
-            
-            # Poczekaj na załadowanie strony po cookies
-            await page.wait_for_load_state("networkidle")
-            
-            # Sprawdź czy przycisk Advanced filters istnieje
-            advanced_btn = page.locator("button:has-text('Advanced filters')")
-            if await advanced_btn.count() > 0:
-                print("✔ Znaleziono przycisk 'Advanced filters'")
-                await advanced_btn.click()
-                await asyncio.sleep(2)
-            else:
-                print("⚠️  Nie znaleziono przycisku 'Advanced filters'")
-                print("   Szukanie alternatywnych selektorów...")
-                
-                # Sprawdź inne możliwe selektory
-                alt_selectors = [
-                    "button[data-test='advanced-filters']",
-                    "button[aria-label*='advanced']",
-                    ".advanced-filters button",
-                    "[data-cy*='advanced'] button"
-                ]
-                
-                for selector in alt_selectors:
-                    alt_btn = page.locator(selector)
-                    if await alt_btn.count() > 0:
-                        print(f"   ✔ Znaleziono alternatywny selektor: {selector}")
-                        await alt_btn.click()
-                        await asyncio.sleep(2)
-                        break
-                else:
-                    print("   Dostępne przyciski na stronie:")
-                    buttons = await page.locator("button").all()
-                    for i, btn in enumerate(buttons[:10]):  # Pierwsze 10 przycisków
-                        text = await btn.inner_text()
-                        if text.strip():  # Tylko przyciski z tekstem
-                            print(f"     {i}: '{text.strip()}'")
-            
-            # Sprawdź czy można ustawić datę
-            date_selectors = [
-                "input[placeholder='DD/MM/YYYY']",
-                "input[type='date']",
-                "input[placeholder*='date']",
-                ".date-picker input"
-            ]
-            
-            date_input = None
-            for selector in date_selectors:
-                test_input = page.locator(selector).first
-                if await test_input.count() > 0:
-                    date_input = test_input
-                    print(f"✔ Znaleziono pole daty: {selector}")
-                    break
-            
-            if date_input:
-                yesterday = pendulum.yesterday().format("DD/MM/YYYY")
-                print(f"✔ Ustawianie daty: {yesterday}")
-                await date_input.fill(yesterday)
-                await date_input.press("Enter")
-                await asyncio.sleep(2)
-            else:
-                print("⚠️  Nie znaleziono pola daty")
-                print("   Dostępne pola input:")
-                inputs = await page.locator("input").all()
-                for i, inp in enumerate(inputs[:5]):
-                    placeholder = await inp.get_attribute("placeholder")
-                    input_type = await inp.get_attribute("type")
-                    print(f"     {i}: type='{input_type}' placeholder='{placeholder}'")
-            
-            # Sprawdź czy przycisk Download CSV istnieje
-            download_selectors = [
-                "button:has-text('Download CSV')",
-                "button:has-text('Download')",
-                "a:has-text('Download CSV')",
-                "[data-test*='download'] button",
-                ".download-csv",
-                ".export-csv"
-            ]
-            
-            download_btn = None
-            for selector in download_selectors:
-                test_btn = page.locator(selector)
-                if await test_btn.count() > 0:
-                    download_btn = test_btn.first
-                    print(f"✔ Znaleziono przycisk download: {selector}")
-                    break
-            
-            if download_btn:
-                print("🔄 Próba pobrania CSV...")
-                
-                # Próba pobrania
-                with page.expect_download(timeout=DOWNLOAD_TIMEOUT * 1000) as dl_info:
-                    await download_btn.click()
-                    print("⏳ Oczekiwanie na download...")
-                
-                download = await dl_info.value
-                csv_path = await download.path()
-                
-                # Przenieś do naszego folderu
-                Path(csv_path).rename(out_path)
-                print(f"✔ Zapisano: {out_path}")
-                print(f"   Rozmiar: {out_path.stat().st_size/1e6:.1f} MB")
-                
-            else:
-                print("⚠️  Nie znaleziono przycisku download")
-                print("   Wszystkie linki na stronie:")
-                links = await page.locator("a").all()
-                for i, link in enumerate(links[:10]):
-                    text = await link.inner_text()
-                    href = await link.get_attribute("href")
-                    if "download" in (text + str(href)).lower():
-                        print(f"     {i}: '{text}' -> {href}")
-            
+            downloaded = await _do_harvest(ctx, out_path, done_marker)
         except Exception as e:
-            print(f"❌ Błąd: {e}")
-            # Zrób screenshot dla debugowania
-            screenshot_path = f"debug_screenshot_{pendulum.now().format('HH-mm-ss')}.png"
-            await page.screenshot(path=screenshot_path)
-            print(f"   Screenshot zapisany: {screenshot_path}")
-            
+            print(f"❌ Wszystkie próby nieudane: {e}")
+            downloaded = False
         finally:
             await browser.close()
 
-    return str(out_path) if out_path.exists() else None
+    # Flaga zamiast kolejnego exists() - wynik znamy z przebiegu
+    return str(out_path) if downloaded else None
 
 if __name__ == "__main__":
     print("=== Test EU CTIS Harvester (bez AWS S3) ===")
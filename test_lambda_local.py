@@ -3,12 +3,15 @@
 Test lokalny Lambda handler przed deployment.
 """
 
-import json
-from lambda_handler import lambda_handler
+import orjson
 
 def test_lambda_locally():
     """Test funkcji Lambda lokalnie."""
-    
+    # Import dopiero tutaj - lambda_handler ciągnie za sobą boto3 i spółkę,
+    # a samo zaimportowanie tego modułu (np. kolekcja pytest) nie powinno
+    # płacić sekund cold-importu
+    from lambda_handler import lambda_handler
+
     print("🧪 Test Lambda handler lokalnie...")
     
     # Symulacja EventBridge event
@@ -42,7 +45,10 @@ def test_lambda_locally():
         print("\n" + "="*50)
         print("📊 REZULTAT TESTU:")
         print("="*50)
-        print(json.dumps(result, indent=2, default=str))
+        # orjson jest wielokrotnie szybszy od json przy pretty-princie
+        # i natywnie serializuje datetime, więc default=str prawie
+        # nigdy nie odpala
+        print(orjson.dumps(result, option=orjson.OPT_INDENT_2, default=str).decode())
         print("="*50)
         
         if result['statusCode'] == 200: